@@ -3,6 +3,7 @@
 ClawCloud 自动登录脚本
 - 等待设备验证批准（30秒）
 - 每次登录后自动更新 Cookie
+- 复用 ClawCloud 登录状态，有效时跳过 GitHub OAuth
 - Telegram 通知
 """
 
@@ -10,15 +11,77 @@ import os
 import sys
 import time
 import base64
+import json
 import re
+import random
 import requests
-from playwright.sync_api import sync_playwright
+from collections import deque
+from requests.adapters import HTTPAdapter
+from playwright.sync_api import sync_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeout
 
 # ==================== 配置 ====================
 CLAW_CLOUD_URL = "https://us-west-1.run.claw.cloud"
 SIGNIN_URL = f"{CLAW_CLOUD_URL}/signin"
+# 按域名匹配，避免 OAuth 页 redirect_uri 参数里的 claw.cloud 误判
+CLAW_READY = re.compile(r"^https://[^/?#]*claw\.cloud(?!.*signin)", re.I)
 DEVICE_VERIFY_WAIT = 30  # Mobile验证 默认等 30 秒
+STATE_CHECK_WAIT = 10  # 等前端决定是否跳回 signin 的最长秒数
+# 只在登录后才渲染的控制台元素，出现即视为已登录（没匹配到也只是等满 STATE_CHECK_WAIT）
+CONSOLE_READY = '[class*="avatar" i], [aria-label*="account" i], [data-testid*="user" i]'
 TWO_FACTOR_WAIT = int(os.environ.get("TWO_FACTOR_WAIT", "120"))  # 2FA验证 默认等 120 秒
+LOG_ICONS = {"INFO": "ℹ️", "SUCCESS": "✅", "ERROR": "❌", "WARN": "⚠️", "STEP": "🔹"}
+GH_LOGIN_URLS = ('github.com/login', 'github.com/session')
+GH_LOGIN_FORM = re.compile(r"github\.com/login(?:[?#]|$)")  # 仅登录表单页，不含 /login/oauth
+DEVICE_VERIFY_URLS = ('verified-device', 'device-verification')
+# 只按 URL 拦截图片/字体/媒体（保留 stylesheet，截图仍可看），其它请求不经过 Python 路由
+BLOCKED_FILES = re.compile(r"\.(png|jpe?g|gif|webp|avif|svg|ico|woff2?|ttf|otf|mp4|webm)(?:[?#]|$)|avatars\.githubusercontent\.com", re.I)
+BLOCKED_HOSTS = re.compile(
+    r"^https?://([^/?#]*\.)?(google-analytics\.com|googletagmanager\.com|doubleclick\.net"
+    r"|segment\.(io|com)|sentry\.io|hotjar\.com)(?:[:/?#]|$)",
+    re.I
+)  # 按域名匹配，避免误拦 URL 路径/参数里带这些词的资源
+
+# login_github 的返回值，非 LOGIN_OK 时直接失败，不再等待重定向
+LOGIN_OK = "成功"
+LOGIN_2FA = "两步验证未通过"
+LOGIN_DEVICE = "设备验证超时"
+LOGIN_BAD_CREDS = "用户名或密码错误"
+LOGIN_RATE_LIMITED = "尝试次数过多，已被 GitHub 限制"
+LOGIN_ERROR = "登录出错"
+
+
+def retry(fn, max_retries=3, base=1.0, cap=30.0):
+    """指数退避 + 抖动重试：只重试网络异常、超时、429 和 5xx，其它 4xx 直接返回"""
+    for attempt in range(max_retries + 1):
+        try:
+            r = fn()
+        except (requests.exceptions.RequestException, PlaywrightError):
+            if attempt == max_retries:
+                raise
+        else:
+            status = getattr(r, 'status_code', None)
+            if status is None or (status != 429 and status < 500) or attempt == max_retries:
+                return r
+            if status == 429:
+                # Telegram 限流时按 retry_after 等待，否则可能又落在限流窗口内；超过 cap 就放弃
+                try:
+                    retry_after = float(r.json()["parameters"]["retry_after"])
+                except:
+                    retry_after = None
+                if retry_after is not None:
+                    if retry_after > cap:
+                        return r
+                    time.sleep(retry_after)
+                    continue
+        time.sleep(min(cap, base * 2 ** attempt) * (1 + random.random() * 0.5))
+
+
+def any_of(page, sels):
+    """把多个 selector 合并成一个 locator，一次等待匹配任意一个可见元素"""
+    loc = page.locator(f"{sels[0]} >> visible=true")
+    for s in sels[1:]:
+        loc = loc.or_(page.locator(f"{s} >> visible=true"))
+    return loc.first
 
 
 class Telegram:
@@ -28,40 +91,71 @@ class Telegram:
         self.token = os.environ.get('TG_BOT_TOKEN')
         self.chat_id = os.environ.get('TG_CHAT_ID')
         self.ok = bool(self.token and self.chat_id)
+        # 复用同一个连接池，避免每次请求都重新握手
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=5))
+        self.base_url = f"https://api.telegram.org/bot{self.token}"
+        self.message_url = f"{self.base_url}/sendMessage"
+        self.photo_url = f"{self.base_url}/sendPhoto"
+        self.album_url = f"{self.base_url}/sendMediaGroup"
+        self.updates_url = f"{self.base_url}/getUpdates"
     
     def send(self, msg):
         if not self.ok:
             return
         try:
-            requests.post(
-                f"https://api.telegram.org/bot{self.token}/sendMessage",
+            retry(lambda: self.session.post(
+                self.message_url,
                 data={"chat_id": self.chat_id, "text": msg, "parse_mode": "HTML"},
                 timeout=30
-            )
+            ))
         except:
             pass
     
-    def photo(self, path, caption=""):
-        if not self.ok or not os.path.exists(path):
+    def photo(self, shot, caption="", max_retries=3):
+        """shot 为 (文件名, 图片字节)，直接从内存上传"""
+        if not self.ok or not shot:
             return
         try:
-            with open(path, 'rb') as f:
-                requests.post(
-                    f"https://api.telegram.org/bot{self.token}/sendPhoto",
-                    data={"chat_id": self.chat_id, "caption": caption[:1024]},
-                    files={"photo": f},
-                    timeout=60
-                )
+            retry(lambda: self.session.post(
+                self.photo_url,
+                data={"chat_id": self.chat_id, "caption": caption[:1024]},
+                files={"photo": shot},
+                timeout=60
+            ), max_retries=max_retries)
         except:
             pass
     
+    def album(self, shots, caption=""):
+        """用 sendMediaGroup 把多张图片合成相册发送，每次最多 10 张"""
+        if not self.ok or not shots:
+            return
+        for i in range(0, len(shots), 10):
+            chunk = shots[i:i + 10]
+            if len(chunk) == 1:
+                self.photo(chunk[0], f"{caption}\n{chunk[0][0]}" if caption else chunk[0][0])
+                continue
+            media = [
+                {"type": "photo", "media": f"attach://photo{j}", "caption": f"{caption}\n{shot[0]}" if j == 0 and caption else shot[0]}
+                for j, shot in enumerate(chunk)
+            ]
+            try:
+                retry(lambda: self.session.post(
+                    self.album_url,
+                    data={"chat_id": self.chat_id, "media": json.dumps(media)},
+                    files={f"photo{j}": shot for j, shot in enumerate(chunk)},
+                    timeout=120
+                ))
+            except:
+                pass
+    
     def flush_updates(self):
         """刷新 offset 到最新，避免读到旧消息"""
         if not self.ok:
             return 0
         try:
-            r = requests.get(
-                f"https://api.telegram.org/bot{self.token}/getUpdates",
+            r = self.session.get(
+                self.updates_url,
                 params={"timeout": 0},
                 timeout=10
             )
@@ -87,8 +181,8 @@ class Telegram:
         
         while time.time() < deadline:
             try:
-                r = requests.get(
-                    f"https://api.telegram.org/bot{self.token}/getUpdates",
+                r = self.session.get(
+                    self.updates_url,
                     params={"timeout": 20, "offset": offset},
                     timeout=30
                 )
@@ -163,6 +257,20 @@ class SecretUpdater:
         except Exception as e:
             print(f"更新 Secret 失败: {e}")
             return False
+    
+    def delete(self, name):
+        if not self.ok:
+            return False
+        try:
+            r = requests.delete(
+                f"https://api.github.com/repos/{self.repo}/actions/secrets/{name}",
+                headers={"Authorization": f"token {self.token}", "Accept": "application/vnd.github.v3+json"},
+                timeout=30
+            )
+            return r.status_code in [204, 404]
+        except Exception as e:
+            print(f"删除 Secret 失败: {e}")
+            return False
 
 
 class AutoLogin:
@@ -172,39 +280,36 @@ class AutoLogin:
         self.username = os.environ.get('GH_USERNAME')
         self.password = os.environ.get('GH_PASSWORD')
         self.gh_session = os.environ.get('GH_SESSION', '').strip()
+        self.claw_state = os.environ.get('CLAW_STATE', '').strip()
         self.tg = Telegram()
         self.secret = SecretUpdater()
-        self.shots = []
-        self.logs = []
+        self.shots = deque(maxlen=8)  # 只保留最近 8 张截图
+        self.logs = deque(maxlen=6)  # 通知里只带最近 6 行日志
         self.n = 0
         
     def log(self, msg, level="INFO"):
-        icons = {"INFO": "ℹ️", "SUCCESS": "✅", "ERROR": "❌", "WARN": "⚠️", "STEP": "🔹"}
-        line = f"{icons.get(level, '•')} {msg}"
+        line = f"{LOG_ICONS.get(level, '•')} {msg}"
         print(line)
         self.logs.append(line)
     
     def shot(self, page, name):
+        """截图只保存在内存里，需要发送时才上传"""
         self.n += 1
-        f = f"{self.n:02d}_{name}.png"
         try:
-            page.screenshot(path=f)
-            self.shots.append(f)
+            shot = (f"{self.n:02d}_{name}.jpg", page.screenshot(type="jpeg", quality=75, full_page=False))
         except:
-            pass
-        return f
+            return None
+        self.shots.append(shot)
+        return shot
     
     def click(self, page, sels, desc=""):
-        for s in sels:
-            try:
-                el = page.locator(s).first
-                if el.is_visible(timeout=3000):
-                    el.click()
-                    self.log(f"已点击: {desc}", "SUCCESS")
-                    return True
-            except:
-                pass
-        return False
+        try:
+            # click 自带可见/可点击等待，不用逐个 selector 探测
+            any_of(page, sels).click(timeout=8000)
+            self.log(f"已点击: {desc}", "SUCCESS")
+            return True
+        except:
+            return False
     
     def get_session(self, context):
         """提取 Session Cookie"""
@@ -235,6 +340,71 @@ class AutoLogin:
 <code>{value}</code>""")
             self.log("已通过 Telegram 发送 Cookie", "SUCCESS")
     
+    def load_state(self):
+        """读取上次保存的 ClawCloud 登录状态"""
+        if not self.claw_state:
+            return None
+        try:
+            return json.loads(self.claw_state)
+        except:
+            self.log("CLAW_STATE 无效，已忽略", "WARN")
+            return None
+    
+    def wait_session(self, page):
+        """等前端决定去留：跳回 signin 返回 False，出现控制台元素或等满仍在控制台返回 True"""
+        try:
+            page.wait_for_function(
+                "sel => location.href.toLowerCase().includes('signin') || !!document.querySelector(sel)",
+                arg=CONSOLE_READY,
+                timeout=STATE_CHECK_WAIT * 1000
+            )
+        except PlaywrightError:
+            pass  # 超时，或整页跳转导致执行上下文销毁，下面按 URL 判断
+        url = page.url
+        return 'signin' not in url.lower() and bool(CLAW_READY.search(url))
+    
+    def check_state(self, page, context):
+        """用保存的登录状态打开控制台，有效返回 True；失效则清除，走 GitHub 登录"""
+        self.log("步骤0: 复用登录状态", "STEP")
+        # 只是探测，不重试；失败直接走 GitHub 登录
+        try:
+            page.goto(f"{CLAW_CLOUD_URL}/apps", timeout=30000, wait_until='domcontentloaded')
+        except PlaywrightError as e:
+            self.log(f"打开控制台失败: {e}", "WARN")
+            return False
+        
+        # 会话依赖 localStorage，是否跳回 signin 由前端 JS 决定
+        if self.wait_session(page):
+            self.log("登录状态有效，跳过 GitHub 登录", "SUCCESS")
+            return True
+        
+        self.log("登录状态已失效，已清除", "WARN")
+        try:
+            page.evaluate("() => localStorage.clear()")
+            context.clear_cookies()
+        except:
+            pass
+        self.claw_state = ''
+        if self.secret.delete('CLAW_STATE'):
+            self.log("已删除失效的 CLAW_STATE", "SUCCESS")
+        return False
+    
+    def save_state(self, context):
+        """保存 ClawCloud 登录状态，下次直接复用"""
+        if not self.secret.ok:
+            return
+        try:
+            state = context.storage_state()
+            # 只保留 ClawCloud 的部分，GitHub Cookie 仍由 GH_SESSION 管理
+            state = {
+                "cookies": [c for c in state["cookies"] if 'claw.cloud' in c.get('domain', '')],
+                "origins": [o for o in state["origins"] if 'claw.cloud' in o.get('origin', '')]
+            }
+            if self.secret.update('CLAW_STATE', json.dumps(state, separators=(',', ':'))):
+                self.log("已自动更新 CLAW_STATE", "SUCCESS")
+        except Exception as e:
+            self.log(f"保存登录状态失败: {e}", "WARN")
+    
     def wait_device(self, page):
         """等待设备验证"""
         self.log(f"需要设备验证，等待 {DEVICE_VERIFY_WAIT} 秒...", "WARN")
@@ -250,21 +420,21 @@ class AutoLogin:
             self.tg.photo(self.shots[-1], "设备验证页面")
         
         for i in range(DEVICE_VERIFY_WAIT):
-            time.sleep(1)
+            page.wait_for_timeout(1000)  # 让 Playwright 继续处理页面事件
             if i % 5 == 0:
                 self.log(f"  等待... ({i}/{DEVICE_VERIFY_WAIT}秒)")
                 url = page.url
-                if 'verified-device' not in url and 'device-verification' not in url:
+                if not any(s in url for s in DEVICE_VERIFY_URLS):
                     self.log("设备验证通过！", "SUCCESS")
                     self.tg.send("✅ <b>设备验证通过</b>")
                     return True
                 try:
-                    page.reload(timeout=10000)
-                    page.wait_for_load_state('networkidle', timeout=10000)
+                    page.reload(timeout=10000, wait_until='domcontentloaded')
                 except:
                     pass
         
-        if 'verified-device' not in page.url:
+        url = page.url
+        if not any(s in url for s in DEVICE_VERIFY_URLS):
             return True
         
         self.log("设备验证超时", "ERROR")
@@ -286,7 +456,7 @@ class AutoLogin:
         
         # 不要频繁 reload，避免把流程刷回登录页
         for i in range(TWO_FACTOR_WAIT):
-            time.sleep(1)
+            page.wait_for_timeout(1000)  # 让 Playwright 继续处理页面事件
             
             url = page.url
             
@@ -306,7 +476,8 @@ class AutoLogin:
                 self.log(f"  等待... ({i}/{TWO_FACTOR_WAIT}秒)")
                 shot = self.shot(page, f"两步验证_{i}s")
                 if shot:
-                    self.tg.photo(shot, f"两步验证页面（第{i}秒）")
+                    # 倒计时中不重试，避免阻塞批准等待
+                    self.tg.photo(shot, f"两步验证页面（第{i}秒）", max_retries=0)
             
             # 只在 30 秒、60 秒... 做一次轻刷新（可选，频率很低）
             if i % 30 == 0 and i != 0:
@@ -333,18 +504,10 @@ class AutoLogin:
                 'button:has-text("Use an authentication app")',
                 '[href*="two-factor/app"]'
             ]
-            for sel in more_options:
-                try:
-                    el = page.locator(sel).first
-                    if el.is_visible(timeout=2000):
-                        el.click()
-                        time.sleep(2)
-                        page.wait_for_load_state('networkidle', timeout=15000)
-                        self.log("已切换到验证码输入页面", "SUCCESS")
-                        shot = self.shot(page, "两步验证_code_切换后")
-                        break
-                except:
-                    pass
+            any_of(page, more_options).click(timeout=2000)
+            page.wait_for_load_state('domcontentloaded', timeout=15000)
+            self.log("已切换到验证码输入页面", "SUCCESS")
+            shot = self.shot(page, "两步验证_code_切换后")
         except:
             pass
         
@@ -380,58 +543,79 @@ class AutoLogin:
             'input[inputmode="numeric"]'
         ]
         
-        for sel in selectors:
+        try:
+            el = any_of(page, selectors)
+            el.wait_for(state='visible', timeout=5000)
+            el.fill(code)
+        except:
+            el = None
+        
+        if el:
+            self.log(f"已填入验证码", "SUCCESS")
+            page.wait_for_timeout(1000)
+            
+            # 优先点击 Verify 按钮，不行再 Enter
+            submitted = False
+            verify_btns = [
+                'button:has-text("Verify")',
+                'button[type="submit"]',
+                'input[type="submit"]'
+            ]
+            # 按优先级逐个查找（页面已加载，count 不等待），避免靠前的其它 submit 按钮抢先
+            for btn_sel in verify_btns:
+                try:
+                    btn = page.locator(f"{btn_sel} >> visible=true").first
+                    if btn.count():
+                        btn.click()
+                        submitted = True
+                        self.log("已点击 Verify 按钮", "SUCCESS")
+                        break
+                except:
+                    pass
+            
+            if not submitted:
+                page.keyboard.press("Enter")
+                self.log("已按 Enter 提交", "SUCCESS")
+            
             try:
-                el = page.locator(sel).first
-                if el.is_visible(timeout=2000):
-                    el.fill(code)
-                    self.log(f"已填入验证码", "SUCCESS")
-                    time.sleep(1)
-                    
-                    # 优先点击 Verify 按钮，不行再 Enter
-                    submitted = False
-                    verify_btns = [
-                        'button:has-text("Verify")',
-                        'button[type="submit"]',
-                        'input[type="submit"]'
-                    ]
-                    for btn_sel in verify_btns:
-                        try:
-                            btn = page.locator(btn_sel).first
-                            if btn.is_visible(timeout=1000):
-                                btn.click()
-                                submitted = True
-                                self.log("已点击 Verify 按钮", "SUCCESS")
-                                break
-                        except:
-                            pass
-                    
-                    if not submitted:
-                        page.keyboard.press("Enter")
-                        self.log("已按 Enter 提交", "SUCCESS")
-                    
-                    time.sleep(3)
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    self.shot(page, "验证码提交后")
-                    
-                    # 检查是否通过
-                    if "github.com/sessions/two-factor/" not in page.url:
-                        self.log("验证码验证通过！", "SUCCESS")
-                        self.tg.send("✅ <b>验证码验证通过</b>")
-                        return True
-                    else:
-                        self.log("验证码可能错误", "ERROR")
-                        self.tg.send("❌ <b>验证码可能错误，请检查后重试</b>")
-                        return False
-            except:
+                page.wait_for_url(lambda u: "github.com/sessions/two-factor/" not in u, timeout=30000)
+            except PlaywrightTimeout:
                 pass
+            self.shot(page, "验证码提交后")
+            
+            # 检查是否通过
+            if "github.com/sessions/two-factor/" not in page.url:
+                self.log("验证码验证通过！", "SUCCESS")
+                self.tg.send("✅ <b>验证码验证通过</b>")
+                return True
+            else:
+                self.log("验证码可能错误", "ERROR")
+                self.tg.send("❌ <b>验证码可能错误，请检查后重试</b>")
+                return False
         
         self.log("没找到验证码输入框", "ERROR")
         self.tg.send("❌ <b>没找到验证码输入框</b>")
         return False
     
+    def login_error(self, page):
+        """读取 GitHub 错误提示，没有错误返回 None"""
+        try:
+            err = page.locator('.flash-error').first
+            if not err.is_visible():
+                return None
+            text = err.inner_text()
+        except:
+            return None
+        self.log(f"错误: {text}", "ERROR")
+        text = text.lower()
+        if 'incorrect' in text:
+            return LOGIN_BAD_CREDS
+        if 'too many' in text:
+            return LOGIN_RATE_LIMITED
+        return LOGIN_ERROR
+    
     def login_github(self, page, context):
-        """登录 GitHub"""
+        """登录 GitHub，返回 LOGIN_* 状态"""
         self.log("登录 GitHub...", "STEP")
         self.shot(page, "github_登录页")
         
@@ -441,7 +625,7 @@ class AutoLogin:
             self.log("已输入凭据")
         except Exception as e:
             self.log(f"输入失败: {e}", "ERROR")
-            return False
+            return LOGIN_ERROR
         
         self.shot(page, "github_已填写")
         
@@ -450,96 +634,127 @@ class AutoLogin:
         except:
             pass
         
-        time.sleep(3)
-        page.wait_for_load_state('networkidle', timeout=30000)
+        # 等待离开登录表单页，不等 networkidle（密码错误时会停在 /session）
+        try:
+            page.wait_for_url(lambda u: not GH_LOGIN_FORM.search(u), timeout=30000)
+            page.wait_for_load_state('domcontentloaded', timeout=15000)
+        except PlaywrightTimeout:
+            pass
         self.shot(page, "github_登录后")
         
         url = page.url
         self.log(f"当前: {url}")
         
+        # 密码错误/被限流无法恢复，立即返回
+        status = self.login_error(page)
+        if status:
+            return status
+        
         # 设备验证
-        if 'verified-device' in url or 'device-verification' in url:
+        if any(s in url for s in DEVICE_VERIFY_URLS):
             if not self.wait_device(page):
-                return False
-            time.sleep(2)
-            page.wait_for_load_state('networkidle', timeout=30000)
+                return LOGIN_DEVICE
+            page.wait_for_load_state('domcontentloaded', timeout=30000)
             self.shot(page, "验证后")
+            url = page.url
         
         # 2FA
-        if 'two-factor' in page.url:
+        if 'two-factor' in url:
             self.log("需要两步验证！", "WARN")
             self.shot(page, "两步验证")
             
             # GitHub Mobile：等待你在手机上批准
-            if 'two-factor/mobile' in page.url:
+            if 'two-factor/mobile' in url:
                 if not self.wait_two_factor_mobile(page):
-                    return False
+                    return LOGIN_2FA
                 # 通过后等页面稳定
                 try:
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    time.sleep(2)
+                    page.wait_for_load_state('domcontentloaded', timeout=30000)
                 except:
                     pass
             
             else:
                 # 其它两步验证方式（TOTP/恢复码等），尝试通过 Telegram 输入验证码
                 if not self.handle_2fa_code_input(page):
-                    return False
+                    return LOGIN_2FA
                 # 通过后等页面稳定
                 try:
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    time.sleep(2)
+                    page.wait_for_load_state('domcontentloaded', timeout=30000)
                 except:
                     pass
         
         # 错误
-        try:
-            err = page.locator('.flash-error').first
-            if err.is_visible(timeout=2000):
-                self.log(f"错误: {err.inner_text()}", "ERROR")
-                return False
-        except:
-            pass
-        
-        return True
+        return self.login_error(page) or LOGIN_OK
     
-    def oauth(self, page):
-        """处理 OAuth"""
-        if 'github.com/login/oauth/authorize' in page.url:
-            self.log("处理 OAuth...", "STEP")
-            self.shot(page, "oauth")
-            self.click(page, ['button[name="authorize"]', 'button:has-text("Authorize")'], "授权")
-            time.sleep(3)
-            page.wait_for_load_state('networkidle', timeout=30000)
+    def oauth(self, page, url=None):
+        """处理 OAuth：点击授权，跳回 ClawCloud 即返回（已读取过 URL 时直接传入）"""
+        if 'github.com/login/oauth/authorize' not in (url or page.url):
+            return
+        self.log("处理 OAuth...", "STEP")
+        self.shot(page, "oauth")
+        try:
+            with page.expect_navigation(url=CLAW_READY, timeout=45000):
+                # 优先精确的授权按钮，按钮文案匹配只作兜底；取 first 避免 strict 模式报错
+                page.locator('button[name="authorize"][value="1"]').or_(
+                    page.get_by_role('button', name=re.compile(r'^\s*Authorize\b', re.I))
+                ).first.click()
+            self.log("已点击: 授权", "SUCCESS")
+        except PlaywrightError as e:
+            self.log(f"授权后未跳回 ClawCloud: {e}", "WARN")
     
     def wait_redirect(self, page, wait=60):
         """等待重定向"""
         self.log("等待重定向...", "STEP")
-        for i in range(wait):
-            url = page.url
-            if 'claw.cloud' in url and 'signin' not in url.lower():
-                self.log("重定向成功！", "SUCCESS")
-                return True
-            if 'github.com/login/oauth/authorize' in url:
+        try:
+            # 导航提交即返回，不再每秒轮询 page.url
+            page.wait_for_url(
+                lambda u: bool(CLAW_READY.search(u)) or 'github.com/login/oauth/authorize' in u,
+                timeout=wait * 1000
+            )
+            # 授权页在步骤3之后才出现时，在这里补点一次
+            if not CLAW_READY.search(page.url):
                 self.oauth(page)
-            time.sleep(1)
-            if i % 10 == 0:
-                self.log(f"  等待... ({i}秒)")
+                page.wait_for_url(CLAW_READY, timeout=wait * 1000)
+            self.log("重定向成功！", "SUCCESS")
+            return True
+        except PlaywrightTimeout:
+            pass
         self.log("重定向超时", "ERROR")
         return False
     
     def keepalive(self, page):
-        """保活"""
+        """保活（两个页面同时加载），会话已失效时返回 False"""
         self.log("保活...", "STEP")
-        for url, name in [(f"{CLAW_CLOUD_URL}/", "控制台"), (f"{CLAW_CLOUD_URL}/apps", "应用")]:
+        extra = page.context.new_page()
+        visits = [(page, f"{CLAW_CLOUD_URL}/", "控制台"), (extra, f"{CLAW_CLOUD_URL}/apps", "应用")]
+        
+        # sync API 不能多线程驱动页面：先让每个页面开始导航（commit 即返回），再逐个等加载完成
+        started = []
+        for pg, url, name in visits:
             try:
-                page.goto(url, timeout=30000)
-                page.wait_for_load_state('networkidle', timeout=15000)
+                retry(lambda: pg.goto(url, timeout=30000, wait_until='commit'), max_retries=2)
+                started.append((pg, name))
+            except:
+                pass
+        for pg, name in started:
+            try:
+                pg.wait_for_load_state('domcontentloaded', timeout=15000)
                 self.log(f"已访问: {name}", "SUCCESS")
-                time.sleep(2)
             except:
                 pass
+        
+        try:
+            extra.close()
+        except:
+            pass
+        
+        # 只在第一个页面上确认仍是登录状态；它没能打开时 page.url 还是旧地址，直接算失败
+        if not started or started[0][0] is not page or not self.wait_session(page):
+            self.log(f"保活失败，会话已失效: {page.url}", "ERROR")
+            self.shot(page, "保活失败")
+            return False
         self.shot(page, "完成")
+        return True
     
     def notify(self, ok, err=""):
         if not self.tg.ok:
@@ -554,14 +769,13 @@ class AutoLogin:
         if err:
             msg += f"\n<b>错误:</b> {err}"
         
-        msg += "\n\n<b>日志:</b>\n" + "\n".join(self.logs[-6:])
+        msg += "\n\n<b>日志:</b>\n" + "\n".join(self.logs)
         
         self.tg.send(msg)
         
         if self.shots:
             if not ok:
-                for s in self.shots[-3:]:
-                    self.tg.photo(s, s)
+                self.tg.album(list(self.shots)[-3:], "失败截图")
             else:
                 self.tg.photo(self.shots[-1], "完成")
     
@@ -572,6 +786,7 @@ class AutoLogin:
         
         self.log(f"用户名: {self.username}")
         self.log(f"Session: {'有' if self.gh_session else '无'}")
+        self.log(f"登录状态: {'有' if self.claw_state else '无'}")
         self.log(f"密码: {'有' if self.password else '无'}")
         
         if not self.username or not self.password:
@@ -582,13 +797,28 @@ class AutoLogin:
         with sync_playwright() as p:
             browser = p.chromium.launch(headless=True, args=['--no-sandbox'])
             context = browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
+                storage_state=self.load_state(),
+                viewport={'width': 1280, 'height': 720},
                 user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             )
+            # 拦截图片/字体/媒体和统计脚本，只加载登录需要的内容
+            context.route(BLOCKED_FILES, lambda route: route.abort())
+            context.route(BLOCKED_HOSTS, lambda route: route.abort())
             page = context.new_page()
             
             try:
-                # 预加载 Cookie
+                # 0. 有保存的登录状态时先直接打开控制台
+                if self.claw_state and self.check_state(page, context):
+                    self.shot(page, "clawcloud")
+                    if not self.keepalive(page):
+                        self.notify(False, "保活失败")
+                        sys.exit(1)
+                    self.save_state(context)
+                    self.notify(True)
+                    print("\n✅ 成功！\n")
+                    return
+                
+                # 预加载 Cookie（放在检查登录状态之后，避免被清除）
                 if self.gh_session:
                     try:
                         context.add_cookies([
@@ -601,18 +831,20 @@ class AutoLogin:
                 
                 # 1. 访问 ClawCloud
                 self.log("步骤1: 打开 ClawCloud", "STEP")
-                page.goto(SIGNIN_URL, timeout=60000)
-                page.wait_for_load_state('networkidle', timeout=30000)
-                time.sleep(2)
+                retry(lambda: page.goto(SIGNIN_URL, timeout=60000, wait_until='domcontentloaded'), max_retries=2)
                 self.shot(page, "clawcloud")
                 
-                if 'signin' not in page.url.lower():
+                url = page.url
+                if 'signin' not in url.lower():
                     self.log("已登录！", "SUCCESS")
-                    self.keepalive(page)
+                    if not self.keepalive(page):
+                        self.notify(False, "保活失败")
+                        sys.exit(1)
                     # 提取并保存新 Cookie
                     new = self.get_session(context)
                     if new:
                         self.save_cookie(new)
+                    self.save_state(context)
                     self.notify(True)
                     print("\n✅ 成功！\n")
                     return
@@ -628,8 +860,11 @@ class AutoLogin:
                     self.notify(False, "找不到 GitHub 按钮")
                     sys.exit(1)
                 
-                time.sleep(3)
-                page.wait_for_load_state('networkidle', timeout=30000)
+                # 等待离开 signin 页（跳转 GitHub 或直接回到控制台）
+                try:
+                    page.wait_for_url(lambda u: 'signin' not in u.lower(), timeout=30000)
+                except PlaywrightTimeout:
+                    pass
                 self.shot(page, "点击后")
                 
                 url = page.url
@@ -638,14 +873,19 @@ class AutoLogin:
                 # 3. GitHub 登录
                 self.log("步骤3: GitHub 认证", "STEP")
                 
-                if 'github.com/login' in url or 'github.com/session' in url:
-                    if not self.login_github(page, context):
+                # OAuth 页也以 github.com/login 开头，要先判断
+                if 'github.com/login/oauth/authorize' in url:
+                    self.log("Cookie 有效", "SUCCESS")
+                elif any(s in url for s in GH_LOGIN_URLS):
+                    status = self.login_github(page, context)
+                    if status != LOGIN_OK:
                         self.shot(page, "登录失败")
-                        self.notify(False, "GitHub 登录失败")
+                        self.notify(False, f"GitHub 登录失败: {status}")
                         sys.exit(1)
-                elif 'github.com/login/oauth/authorize' in url:
-                    self.log("Cookie 有效", "SUCCESS")
-                    self.oauth(page)
+                    url = page.url
+                
+                # 需要授权时点击后直接等跳回 ClawCloud
+                self.oauth(page, url)
                 
                 # 4. 等待重定向
                 self.log("步骤4: 等待重定向", "STEP")
@@ -658,12 +898,14 @@ class AutoLogin:
                 
                 # 5. 验证
                 self.log("步骤5: 验证", "STEP")
-                if 'claw.cloud' not in page.url or 'signin' in page.url.lower():
+                if not CLAW_READY.search(page.url):
                     self.notify(False, "验证失败")
                     sys.exit(1)
                 
                 # 6. 保活
-                self.keepalive(page)
+                if not self.keepalive(page):
+                    self.notify(False, "保活失败")
+                    sys.exit(1)
                 
                 # 7. 提取并保存新 Cookie
                 self.log("步骤6: 更新 Cookie", "STEP")
@@ -672,6 +914,7 @@ class AutoLogin:
                     self.save_cookie(new)
                 else:
                     self.log("未获取到新 Cookie", "WARN")
+                self.save_state(context)
                 
                 self.notify(True)
                 print("\n" + "="*50)